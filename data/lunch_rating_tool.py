@@ -2,14 +2,15 @@
 
 import curses
 import csv
+import functools
+import heapq
+import json
 import subprocess
 import sys
 import urllib.parse
-import numpy
 import pickle
 import os
 import time
-import tempfile
 import webbrowser
 from difflib import SequenceMatcher
 from typing import Optional
@@ -33,10 +34,9 @@ class TerminalDisplay:
         self.__stdscr = curses.initscr()
         self.height, self.width = self.__stdscr.getmaxyx()
         self.line_count = line_count
-        self.chars = numpy.full((line_count, self.width), " ")
         self.__last_active_lunch = None
-        self.__last_lunch_at_rank = numpy.full(11, None, dtype=object)
-        self.__lunch_ends = numpy.full(11, None, dtype=object)
+        self.__last_lunch_at_rank: list[Optional[str]] = [None] * 11
+        self.__lunch_ends: list[Optional[int]] = [None] * 11
         self.__cursor_y = 0
         self.__last_cursor_y = None
         self.__lunch_x_start = 4+4*collected_properties_count
@@ -51,24 +51,25 @@ class TerminalDisplay:
         for fg in range(COLORS_COUNT):
             for bg in range(COLORS_COUNT):
                 curses.init_pair(self.get_color_pair(fg, bg), fg, bg)
+        # Curses attributes of all color pairs - self.__color_pair_attrs[fg][bg]
+        self.__color_pair_attrs = [[curses.color_pair(self.get_color_pair(fg, bg)) for bg in range(COLORS_COUNT)]
+                                   for fg in range(COLORS_COUNT)]
 
     def write_str(self, y: int, x: int, s: str, fg: int = WHITE, bg: int = BLACK) -> None:
         if y < 0 or y >= self.line_count or x < 0 or x >= self.width:
             return
-        end = x + len(s)
-        if end > self.width:
+        if x + len(s) > self.width:
             s = s[:self.width-x]
-            end = self.width
-        i = 0
-        for c in s:
-            self.chars[y][x+i] = c
-            i += 1
-        self.__stdscr.addstr(y, x, s, curses.color_pair(self.get_color_pair(fg, bg)))
+        self.__stdscr.addstr(y, x, s, self.__color_pair_attrs[fg][bg])
 
+    # Changes the color of already written characters, the characters themselves are not rewritten
     def change_color(self, y: int, from_x: int = 0, to_x: int = -1, fg: int = WHITE, bg: int = BLACK) -> None:
-        if to_x == -1:
+        if y < 0 or y >= self.line_count or from_x < 0 or from_x >= self.width:
+            return
+        if to_x == -1 or to_x is None or to_x > self.width:  # None when there's no lunch at the highlighted rank
             to_x = self.width
-        self.write_str(y, from_x, "".join(self.chars[y][from_x:to_x]), fg, bg)
+        if to_x > from_x:
+            self.__stdscr.chgat(y, from_x, to_x - from_x, self.__color_pair_attrs[fg][bg])
 
     def change_color_at(self, y: int, x: int, fg: int = WHITE, bg: int = BLACK):
         self.change_color(y, x, x+1, fg, bg)
@@ -264,15 +265,83 @@ class TerminalDisplay:
         self.cleanup()
 
 
+# Returns the first two words of s - "kuřecí řízek smažený" > "kuřecí řízek"
+# Cached, because every rated lunch is compared with each next lunch that's being rated
+@functools.cache
+def first_two_words(s: str) -> str:
+    return " ".join(s.split(" ")[:2])
+
 # Compares two strings similarity, returns float [0 - 1]
 def similarity(s1: str, s2: str, prioritize_first_two_words: bool = False) -> float:
     sim = SequenceMatcher(None, s1, s2).ratio()
     if prioritize_first_two_words and s1.count(" ") >= 1 and s2.count(" ") >= 1:
-        s1_first_two, s2_first_two = " ".join(s1.split(" ")[:2]), " ".join(s2.split(" ")[:2])
+        s1_first_two, s2_first_two = first_two_words(s1), first_two_words(s2)
+        if s1_first_two == s2_first_two:  # Very common (e.g. "kuřecí řízek ..."), their ratio() would be 1
+            return (sim + 1) / 2
         sim2 = SequenceMatcher(None, s1_first_two, s2_first_two).ratio()
         return (sim + sim2 ** 3) / 2
     return sim
 
+# Returns SequenceMatchers with seq2 set to s2 and to its first two words
+# Setting seq2 is the expensive part of SequenceMatcher (it indexes all characters of seq2), so the matchers
+#   of every rated lunch are created only once and reused for comparing it with each next lunch
+@functools.cache
+def matchers_of(s2: str) -> tuple[SequenceMatcher, SequenceMatcher]:
+    return SequenceMatcher(None, b=s2), SequenceMatcher(None, b=first_two_words(s2))
+
+# Compares the string s1 with many others, gives the same results as similarity(s1, s2, prioritize_first_two_words)
+# Everything that depends only on s1 is prepared once
+class SimilarityTo:
+    def __init__(self, s1: str, prioritize_first_two_words: bool = False):
+        self.__s1 = s1
+        self.__s1_first_two = first_two_words(s1)
+        self.__prioritize_first_two_words = prioritize_first_two_words and s1.count(" ") >= 1
+
+    def __call__(self, s2: str) -> float:
+        matcher, first_two_matcher = self.__matchers_of(s2)
+        sim = matcher.ratio()
+        if self.__first_two_words_used(s2):
+            if first_two_matcher.b == self.__s1_first_two:  # Very common (e.g. "kuřecí řízek ..."), their ratio() would be 1
+                return (sim + 1) / 2
+            sim2 = first_two_matcher.ratio()
+            return (sim + sim2 ** 3) / 2
+        return sim
+
+    # Returns False if the similarity to s2 is certainly not higher than min_similarity
+    # Uses the cheap upper bounds of SequenceMatcher.ratio(), the cheapest first
+    def may_exceed(self, s2: str, min_similarity: float) -> bool:
+        matcher, first_two_matcher = self.__matchers_of(s2)
+        if self.__first_two_words_used(s2):
+            return (matcher.real_quick_ratio() + first_two_matcher.real_quick_ratio() ** 3) / 2 > min_similarity \
+                and (matcher.quick_ratio() + first_two_matcher.quick_ratio() ** 3) / 2 > min_similarity
+        return matcher.real_quick_ratio() > min_similarity and matcher.quick_ratio() > min_similarity
+
+    def __first_two_words_used(self, s2: str) -> bool:
+        return self.__prioritize_first_two_words and s2.count(" ") >= 1
+
+    def __matchers_of(self, s2: str) -> tuple[SequenceMatcher, SequenceMatcher]:
+        matcher, first_two_matcher = matchers_of(s2)
+        matcher.set_seq1(self.__s1)
+        first_two_matcher.set_seq1(self.__s1_first_two)
+        return matcher, first_two_matcher
+
+# Returns count lunches that are the most similar to lunch_name (using similarity() with prioritize_first_two_words)
+# The result is the same as sorting all lunches by similarity, but the expensive SequenceMatcher.ratio()
+#   is skipped for lunches whose similarity upper bound is too low to get among the count most similar
+def find_most_similar_lunches(lunch_name: str, lunches: dict[str, tuple[int, ...]], count: int = 10) -> list[tuple[str, tuple[int, ...]]]:
+    similarity_to_lunch = SimilarityTo(lunch_name, True)
+    most_similar = []  # Heap of (similarity, -order, lunch), the least similar lunch is at index 0
+    order = 0
+    for lunch in lunches.items():
+        if len(most_similar) < count:
+            heapq.heappush(most_similar, (similarity_to_lunch(lunch[0]), -order, lunch))
+        elif similarity_to_lunch.may_exceed(lunch[0], most_similar[0][0]):
+            sim = similarity_to_lunch(lunch[0])
+            if sim > most_similar[0][0]:  # On equal similarity the earlier lunch stays, like in a stable sort
+                heapq.heapreplace(most_similar, (sim, -order, lunch))
+        order += 1
+    return [lunch for _, _, lunch in sorted(most_similar, reverse=True)]
+
 # Scans all filenames in the current folder and returns the most 'similar'
 # 'similarity' prefers full filename > identical file extension > highest similarity()
 def find_similar_file(file_name: str, min_similarity: float = 0.5) -> Optional[str]:
@@ -282,19 +351,25 @@ def find_similar_file(file_name: str, min_similarity: float = 0.5) -> Optional[s
 
     file_name_base, file_name_ext = os.path.splitext(file_name)
 
-    for current_file in os.listdir('..'):
-        current_file_base, current_file_ext = os.path.splitext(current_file)
+    with os.scandir('..') as entries:
+        for entry in entries:
+            current_file = entry.name
+
+            # Check for an exact match (full name including extension)
+            if current_file == file_name:
+                return current_file
 
-        # Check for an exact match (full name including extension)
-        if current_file == file_name:
-            return current_file
+            # Cheap checks first - skip names with a different ending and directories (scandir knows them without stat)
+            if not current_file.endswith(file_name_ext) or not entry.is_file():
+                continue
 
-        # Check for identical file extension, then compare similarity of bases
-        if current_file_ext == file_name_ext:
-            sim = similarity(file_name_base, current_file_base)
-            if sim > highest_similarity:
-                highest_similarity = sim
-                best_match = current_file
+            # Check for identical file extension, then compare similarity of bases
+            current_file_base, current_file_ext = os.path.splitext(current_file)
+            if current_file_ext == file_name_ext:
+                sim = similarity(file_name_base, current_file_base)
+                if sim > highest_similarity:
+                    highest_similarity = sim
+                    best_match = current_file
 
     return best_match if highest_similarity >= min_similarity else None
 
@@ -332,23 +407,46 @@ def ask(question: str, yes_char: str = "y", no_char: str = "n") -> bool:
         first = False
 
 
-def save_progress(filepath: str, data: object) -> None:
-    directory, filename = os.path.split(filepath)
-    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temp_file:
-        temp_file_name = temp_file.name
-        try:
-            with open(temp_file_name, "wb") as f:
-                pickle.dump(data, f)
-            temp_file.close()
-            os.replace(temp_file_name, filepath)
-        except Exception as e:
-            os.remove(temp_file_name)
-            raise e
-
-def load_progress(filepath: str) -> object:
+# Saves the progress (source_json_file, target_csv_file, collect_property, collect_lunch_data) as a JSON file
+def save_progress(filepath: str, data: tuple[str, str, dict[str, bool], bool]) -> None:
+    source_json_file, target_csv_file, collect_property, collect_lunch_data = data
+    progress_json = {
+        "sourceJsonFile": source_json_file,
+        "targetCsvFile": target_csv_file,
+        "collectProperty": collect_property,
+        "collectLunchData": collect_lunch_data
+    }
+    # Write to a temporary file first, so the progress file is never left half-written
+    temp_filepath = f"{filepath}.tmp"
+    try:
+        with open(temp_filepath, "w", encoding="utf-8") as f:
+            json.dump(progress_json, f, indent=2, ensure_ascii=False)
+        os.replace(temp_filepath, filepath)
+    except Exception as e:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise e
+
+# Progress files saved using pickle (by older versions of this tool) start with this byte
+PICKLE_PROTOCOL_PREFIX = b"\x80"
+
+# Loads the progress saved by save_progress(), returns None if there's no (valid) progress file
+# Older versions of this tool saved the progress using pickle, such files are converted to JSON
+def load_progress(filepath: str) -> Optional[tuple[str, str, dict[str, bool], bool]]:
     try:
         with open(filepath, "rb") as f:
-            return pickle.load(f)
+            content = f.read()
+        if content.startswith(PICKLE_PROTOCOL_PREFIX):
+            data = pickle.loads(content)
+            # The progress was loaded, even if it can't be converted now (it will be converted next time)
+            try:
+                save_progress(filepath, data)
+            except OSError:
+                pass
+            return data
+        progress_json = json.loads(content.decode("utf-8"))
+        return (progress_json["sourceJsonFile"], progress_json["targetCsvFile"],
+                progress_json["collectProperty"], progress_json["collectLunchData"])
     except:
         return None
 
@@ -375,7 +473,7 @@ def load_dataset_csv(filepath: str) -> dict[str, tuple[int, ...]]:
                 header = False
             else:
                 lunch_name: str = row[0]
-                properties = tuple(map(lambda x: int(x), row[1:]))  # Convert the remaining columns to integers
+                properties = tuple(map(int, row[1:]))  # Convert the remaining columns to integers
                 dataset[lunch_name] = properties
     return dataset
 
@@ -411,11 +509,12 @@ def calculate_eta(it_took_seconds: float):
 def pad_with(s: object, desired_len: int, pad_char: str = "0", pad_after: bool = False) -> str:
     if len(pad_char) != 1:
         raise ValueError(f"Pad char must be of len == 1! len('{pad_char}') == {len(pad_char)}")
+    s = str(s)
     if pad_after:
-        if len(str(s)) > desired_len:
+        if len(s) > desired_len:
             raise ValueError(f"When pad_after is enabled, len(s) must be <= desired_len, and len('{s}') is not <= {desired_len}.")
-        return f"{s}{pad_char * (desired_len-len(str(s)))}"
-    return f"{pad_char * desired_len}{s}"[-desired_len:]
+        return s.ljust(desired_len, pad_char)
+    return s.rjust(desired_len, pad_char)[-desired_len:]
 
 
 # Dictionary containing type of data and whether it should be collected
@@ -498,8 +597,7 @@ for lunch_menu in lunch_menus:
 create_dataset_csv_if_needed(target_csv_file)
 dataset_lunches = load_dataset_csv(target_csv_file)
 
-for lunch_name in dataset_lunches.keys():
-    lunches_set.discard(lunch_name)
+lunches_set.difference_update(dataset_lunches.keys())
 
 lunches = list(lunches_set)
 progress, skipped, remains, finished, out_of = len(dataset_lunches), 0, len(lunches), len(dataset_lunches), len(dataset_lunches) + len(lunches)
@@ -542,7 +640,7 @@ eta_days, eta_hours, eta_minutes, eta_seconds = 0, 0, 0, 0
 while len(lunches) > 0:
     start_seconds = time.time()
     curr_lunch_name = lunches.pop()
-    top_matches = sorted(dataset_lunches.items(), key=lambda pair: -similarity(curr_lunch_name, pair[0], True))[:10]
+    top_matches = find_most_similar_lunches(curr_lunch_name, dataset_lunches)
 
     display.set_all(progress, out_of, skipped, remains, finished, eta_days, eta_hours, eta_minutes, eta_seconds, top_matches, curr_lunch_name)
     display.reset_cursor_y()
@@ -1,5 +1,6 @@
 import os
 
+import functools
 import unicodedata
 from difflib import SequenceMatcher
 import re
@@ -11,42 +12,22 @@ import tensorflow as tf
 from tensorflow.keras.preprocessing.text import Tokenizer
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 import numpy as np
+import pandas as pd
 
 from sjrako import Lunch, LunchMenu
 
-def read_dataset(dataset_path: str = f"{ROOT_DIR}/data/lunch-dataset.csv") -> dict[str, dict[str, float]]:
-    dataset_rows = open(dataset_path, "r", encoding="utf-8").read().split("\n")
-    is_header_row = True
-    dataset = {}
+# Returns names of the lunches, their ratings (one row per lunch, one column per property) and names of the properties
+def read_dataset(dataset_path: str = f"{ROOT_DIR}/data/lunch-dataset.csv") -> tuple[list[str], np.ndarray, list[str]]:
+    # Parsed by the C parser of pandas, lunch names are kept as they are (even "NA" and similar)
+    dataset_frame = pd.read_csv(dataset_path, encoding="utf-8", dtype={"lunch_name": str}, keep_default_na=False)
+    dataset_frame = dataset_frame[dataset_frame["lunch_name"] != ""]
+    # A repeated lunch name keeps the position of its first row and the ratings of its last row
+    dataset_frame = dataset_frame.groupby("lunch_name", sort=False, as_index=False).last()
 
-    for row in dataset_rows:
-        values = row.split(",")
+    property_names = [name for name in dataset_frame.columns if name != "lunch_name"]
+    return dataset_frame["lunch_name"].tolist(), dataset_frame[property_names].to_numpy(dtype=np.float32), property_names
 
-        if is_header_row:
-            property_names = list(values)
-            is_header_row = False
-            continue
-
-        lunch_name = ""
-        lunch_properties = {}
-        index = 0
-        for value in values:
-            property_name = property_names[index]
-            if property_name == "lunch_name":
-                lunch_name = value
-            else:
-                lunch_properties[property_name] = float(value)
-            index += 1
-
-        if lunch_name:
-            dataset[lunch_name] = lunch_properties
-
-    return dataset
-
-dataset = read_dataset()
-lunch_names = list(dataset.keys())
-lunch_ratings = [list(properties.values()) for properties in dataset.values()]
-property_names = list(list(dataset.values())[0].keys())
+lunch_names, lunch_ratings, property_names = read_dataset()
 
 
 tokenizer = Tokenizer()
@@ -58,14 +39,17 @@ max_sequence_length = max(len(seq) for seq in sequences)
 
 model_path = f"{ROOT_DIR}/data/lunch-evaluation-model.keras"
 
-# If a model already exists, just load it
-if os.path.exists(model_path):
-    model = tf.keras.models.load_model(model_path)
+# Returns the model, it's loaded (or created) only when it's first needed
+# So importing this library doesn't load Tensorflow model (or train a new one) until a lunch is evaluated
+@functools.cache
+def get_model() -> tf.keras.Model:
+    # If a model already exists, just load it
+    if os.path.exists(model_path):
+        return tf.keras.models.load_model(model_path)
 
-# Otherwise create the model and then save it
-else:
+    # Otherwise create the model and then save it
     lunch_input_vectors = pad_sequences(sequences, maxlen=max_sequence_length, padding='post')
-    desired_property_outputs = np.array(lunch_ratings)
+    desired_property_outputs = lunch_ratings
 
     vocab_size = len(tokenizer.word_index) + 1  # Total number of unique words + 1 for padding
 
@@ -81,26 +65,51 @@ else:
 
     model.fit(lunch_input_vectors, desired_property_outputs, epochs=800, batch_size=50, validation_split=0.1)
     model.save(model_path)
+    return model
 
+# Returns a function computing the model outputs for a batch of padded sequences
+# It runs as a Tensorflow graph, traced only once for all batch sizes, without the overhead of model.predict
+@functools.cache
+def get_predictor():
+    model = get_model()
+    return tf.function(lambda padded_sequences: model(padded_sequences, training=False),
+                       input_signature=[tf.TensorSpec([None, max_sequence_length], tf.int32)])
 
-# Compares the similarity of two words (or strings)
-# Returns a similarity score ranging from 0 to 1 inclusive
-def similarity(word_1: str, word_2: str) -> float:
-    return SequenceMatcher(None, word_1, word_2).ratio()
 
 # Replaces multiple spaces with a single one
+multiple_spaces_pattern = re.compile(" +")
 def only_single_spaces(s: str):
-    return re.sub(" +", " ", s)
+    return multiple_spaces_pattern.sub(" ", s)
+
+# Translation table for remove_diacritics, which fills itself in as new characters come up
+# Each character is decomposed only once, the rest of the work is a single str.translate
+class DiacriticsTable(dict):
+    def __missing__(self, code_point: int) -> str:
+        char = "".join(c for c in unicodedata.normalize("NFD", chr(code_point)) if unicodedata.category(c) != "Mn")
+        self[code_point] = char
+        return char
+
+diacritics_table = DiacriticsTable()
 
 # Removes diacritics from a word (or string) - "Böhnův řízek" > "Bohnuv rizek"
 def remove_diacritics(s: str):
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+    return s.translate(diacritics_table)
 
 
 # Matches a word to the nearest in the embedding matrix - "vepřvý" > "vepřový"
 # Fixes misspellings and different word endings
 # If no word matches, returns "" (empty string)
 no_diacritics_word_map = {remove_diacritics(word): word for word in tokenizer.word_index.keys()}
+# Words of the embedding matrix set as the second sequence, so SequenceMatcher indexes each of them only once
+word_matchers = [SequenceMatcher(None, b=word) for word in tokenizer.word_index.keys()]
+# Indices of word_matchers grouped by the first 4 letters of the word without diacritics and by the length of the word
+words_by_stem: dict[str, list[int]] = {}
+words_by_length: dict[int, list[int]] = {}
+for index, word in enumerate(tokenizer.word_index.keys()):
+    words_by_stem.setdefault(remove_diacritics(word)[:4], []).append(index)
+    words_by_length.setdefault(len(word), []).append(index)
+
+@functools.cache
 def match_word(word: str):
     if word in tokenizer.word_index:
         return word
@@ -110,11 +119,37 @@ def match_word(word: str):
     if word_no_diacritics in no_diacritics_word_map:
         return no_diacritics_word_map[word_no_diacritics]
 
-    similarities = [[similarity(word, w), w] for w in tokenizer.word_index.keys()]
-    similarities.sort(key=lambda x: x[0], reverse=True)
-    highest_similarity, most_similar_word = similarities[0]
+    # Same result as comparing SequenceMatcher(None, word, w).ratio() (similarity from 0 to 1) of every word w,
+    # keeping the first of the most similar words
+    # (similarity, -index) is compared, so that a tie is won by the word which is first in word_index
+    most_similar = (-1, 0)
+    def compare(indices: list[int]):
+        nonlocal most_similar
+        for index in indices:
+            matcher = word_matchers[index]
+            matcher.set_seq1(word)
+            upper_bound = matcher.real_quick_ratio()
+            if upper_bound < 0.5 or (upper_bound, -index) <= most_similar:
+                continue
+            upper_bound = matcher.quick_ratio()
+            if upper_bound < 0.5 or (upper_bound, -index) <= most_similar:
+                continue
+            most_similar = max(most_similar, (matcher.ratio(), -index))
+
+    # Words with the same stem go first - misspellings and different word endings usually keep the stem,
+    # so a close match is found early and most of the other words can be skipped
+    compare(words_by_stem.get(word_no_diacritics[:4], []))
+
+    # Then words of the closest lengths, whole lengths are skipped if even their upper bound can't be reached
+    # (the same bound as SequenceMatcher.real_quick_ratio)
+    for length in sorted(words_by_length, key=lambda length: abs(length - len(word))):
+        upper_bound = 2.0 * min(length, len(word)) / (length + len(word))
+        if upper_bound >= 0.5 and upper_bound >= most_similar[0]:
+            compare(words_by_length[length])
+
+    highest_similarity, most_similar_index = most_similar
     if highest_similarity >= 0.5:
-        return most_similar_word
+        return word_matchers[-most_similar_index].b
     else:
         return ""
 
@@ -125,38 +160,70 @@ def match_words(lunch_name: str):
 
 # Removes all characters not present in the allowed_chars set
 allowed_chars = set("abcdefghijklmnopqrstuvwxyzáäéëíóöúůýčďěňřšťž -.")
+
+# Translation table for keep_only_allowed_chars - allowed characters stay, any other character is deleted
+# Not allowed characters are added (mapped to None) as they come up
+class AllowedCharsTable(dict):
+    def __missing__(self, code_point: int) -> None:
+        self[code_point] = None
+        return None
+
+allowed_chars_table = AllowedCharsTable((ord(c), c) for c in allowed_chars)
+
 def keep_only_allowed_chars(lunch_name: str):
-    return "".join(filter(lambda c: c in allowed_chars, lunch_name))
+    return lunch_name.translate(allowed_chars_table)
+
+# Converts lunch names returned by match_words to padded sequences of word ids for the model
+# Same as tokenizer.texts_to_sequences + pad_sequences (padded and truncated at the start),
+# but matched lunch names contain only words of the embedding matrix, so one dictionary lookup per word is enough
+def encode_lunch_names(matched_lunch_names: list[str]) -> np.ndarray:
+    padded_sequences = np.zeros((len(matched_lunch_names), max_sequence_length), dtype=np.int32)
+    for padded_sequence, matched_lunch_name in zip(padded_sequences, matched_lunch_names):
+        sequence = [tokenizer.word_index[word] for word in matched_lunch_name.split()][-max_sequence_length:]
+        if sequence:
+            padded_sequence[-len(sequence):] = sequence
+    return padded_sequences
+
+# Properties of already evaluated lunch names (after keep_only_allowed_chars)
+# The same lunches repeat in many lunch menus, so each of them is evaluated by the model only once
+evaluated_lunches: dict[str, tuple[int, ...]] = {}
 
 # Returns a dictionary of properties
 # For example: evaluate_lunch("kuřecí řízek smažený, bramborová kaše")
 #   - returns: {'taste': 89, 'meatiness': 86, 'sweetness': 0}
 def evaluate_lunch(lunch_name: str) -> dict[str, int]:
-    lunch_name = keep_only_allowed_chars(lunch_name.lower())
-    matched_lunch_name = match_words(lunch_name)
+    return evaluate_lunches([lunch_name])[0]
+
+# Returns a list of properties dictionaries, one for each lunch name (in the same order)
+def evaluate_lunches(lunch_names: list[str]) -> list[dict[str, int]]:
+    # New dictionaries every time, so the caller can't modify the cached properties
+    return [dict(zip(property_names, properties)) for properties in lunch_properties(lunch_names)]
+
+# Returns a tuple of properties (in the order of property_names) for each lunch name
+# All lunch names not evaluated yet are passed to the model in a single batch
+def lunch_properties(lunch_names: list[str]) -> list[tuple[int, ...]]:
+    lunch_names = [keep_only_allowed_chars(lunch_name.lower()) for lunch_name in lunch_names]
+    new_lunch_names = list(dict.fromkeys(name for name in lunch_names if name not in evaluated_lunches))
+
+    if new_lunch_names:
+        padded_sequences = encode_lunch_names([match_words(lunch_name) for lunch_name in new_lunch_names])
+        predictions = get_predictor()(padded_sequences).numpy()
 
-    sequence = tokenizer.texts_to_sequences([matched_lunch_name])
-    padded_sequence = pad_sequences(sequence, maxlen=max_sequence_length)
-    prediction = model.predict(padded_sequence, verbose=0)
+        # Rounded to integers on scale 0 - 100, all at once
+        predictions = np.clip(predictions, 0, 100).round().astype(int)
+        for lunch_name, prediction in zip(new_lunch_names, predictions.tolist()):
+            evaluated_lunches[lunch_name] = tuple(prediction)
 
-    properties = {}
-    index = 0
-    for property in property_names:
-        properties[property] = int(round(max(0, min(100, prediction[0][index]))))
-        index += 1
-    return properties
+    return [evaluated_lunches[lunch_name] for lunch_name in lunch_names]
 
 # Select the best Lunch from the LunchMenu and return it
+taste_index = property_names.index("taste")
 def select_best_lunch(lunch_menu: LunchMenu) -> Lunch:
-    highest_rating = -1
-    best_lunch = None
-    for lunch in lunch_menu:
-        properties = evaluate_lunch(lunch.main_dish)
-        rating = properties["taste"]
-        if rating > highest_rating:
-            highest_rating = rating
-            best_lunch = lunch
-    return best_lunch
+    if not lunch_menu:
+        return None
+    ratings = np.array(lunch_properties([lunch.main_dish for lunch in lunch_menu]))[:, taste_index]
+    # argmax returns the first of the lunches with the highest rating
+    return lunch_menu[int(ratings.argmax())]
 
 
 # Prints the embedding matrix used for sequence padding
@@ -168,7 +235,7 @@ def select_best_lunch(lunch_menu: LunchMenu) -> Lunch:
 # 8.	"salát": [-0.3613504469394684, -0.03930748999118805, 0.21599996089935303]
 # ...
 def print_embedding_matrix():
-    embedding_layer = model.layers[0]
+    embedding_layer = get_model().layers[0]
     embedding_matrix = embedding_layer.get_weights()[0]
     word_index = tokenizer.word_index
     print("Embedding Matrix Shape:", embedding_matrix.shape)
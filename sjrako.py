@@ -2,13 +2,20 @@
 # Uses selenium to scrape data and interact with the website
 # GitHub "https://github.com/JaLi-CZ/SJRako-AI-Lunch-Selector"
 
+import atexit
+import functools
 import os
-from datetime import datetime, timedelta
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as datetime_date, datetime
 from typing import Optional, Tuple
 
 from selenium.webdriver import Chrome, ChromeOptions, ChromeService
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
@@ -24,9 +31,61 @@ def create_driver() -> WebDriver:
     options = ChromeOptions()
     options.add_argument("--headless=new")
 
+    # Only the text of the pages is needed, don't load images and don't start unused parts of the browser
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-background-networking")
+    options.add_argument("--disable-sync")
+    options.add_argument("--disable-dev-shm-usage")
+
     driver = Chrome(options, ChromeService(driver_path))
     return driver
 
+# Drivers nobody uses at the moment, they are reused instead of starting a new browser every time
+# Drivers can be acquired and released from multiple threads, the list is guarded by idle_drivers_lock
+idle_drivers: list[WebDriver] = []
+idle_drivers_lock = threading.Lock()
+max_idle_drivers = min(4, os.cpu_count() or 1)
+
+# Returns an idle driver if there is one, otherwise creates a new one
+def acquire_driver() -> WebDriver:
+    with idle_drivers_lock:
+        if idle_drivers:
+            return idle_drivers.pop()
+    return create_driver()
+
+# Gives the driver back to be reused by someone else (without cookies, so no login session is shared)
+# Called from finally blocks, so it doesn't raise - a driver which can't be cleaned up is quit instead
+def release_driver(driver: WebDriver) -> None:
+    try:
+        driver.delete_all_cookies()
+    except Exception:  # The browser probably crashed, it can't be reused
+        quit_driver(driver)
+        return
+    with idle_drivers_lock:
+        if len(idle_drivers) < max_idle_drivers:
+            idle_drivers.append(driver)
+            return
+    quit_driver(driver)
+
+# Quits the driver, errors are ignored (the browser might not be running anymore)
+def quit_driver(driver: WebDriver) -> None:
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+# Quits all idle drivers, so no browser keeps running after the program ends
+@atexit.register
+def quit_idle_drivers() -> None:
+    with idle_drivers_lock:
+        drivers = idle_drivers.copy()
+        idle_drivers.clear()
+    for driver in drivers:
+        quit_driver(driver)
+
 # Wait until the page body is loaded
 def wait_for_page_load(driver: WebDriver, wait_for_el: Tuple[str, str] = (By.TAG_NAME, "body"),
                        wait_for_multiple: bool = False, timeout: float = 10) -> None:
@@ -38,21 +97,85 @@ def wait_for_page_load(driver: WebDriver, wait_for_el: Tuple[str, str] = (By.TAG
 
 # Reads the price string and returns float
 # For example: ' 158,7 Kč ' -> 158.7
-allowed_price_chars = "0123456789."
+not_price_chars_pattern = re.compile("[^0-9.]")
 def read_price(s: str) -> float:
-    price = ""
-    was_dot = False
-    for c in s.replace(",", "."):
-        if c == ".":
-            if was_dot:
-                continue
-            was_dot = True
-        if c in allowed_price_chars:
-            price += c
-    return float(price)
-
-
-class Date:
+    # Only digits and the first dot are kept
+    price = not_price_chars_pattern.sub("", s.replace(",", "."))
+    integer_part, dot, decimal_part = price.partition(".")
+    return float(integer_part + dot + decimal_part.replace(".", ""))
+
+
+# Returns the text of an element similar to WebElement.text (trimmed lines, no non-breaking spaces, "" if hidden)
+# It's only an approximation - innerText can put a different number of blank lines between block elements
+# (the lunch texts don't depend on that, line breaks are removed from the dishes anyway)
+element_text_script = """
+    const text = element => element.checkVisibility() ?
+        element.innerText.replace(/\\u00a0/g, " ").split("\\n").map(line => line.trim()).join("\\n").trim() : "";
+"""
+
+# Returns data of all lunch items (".jidelnicekItem") on the page at once, instead of a few WebDriver commands per item
+lunch_items_script = element_text_script + """
+    return Array.from(document.querySelectorAll(".jidelnicekItem"), lunchItem => {
+        const menu = lunchItem.querySelector("[id^='menu-']");
+        const button = lunchItem.querySelector(".btn");
+        const anchor = lunchItem.querySelector("a");
+        return {
+            menuText: menu && text(menu),
+            buttonText: button && text(button),
+            anchor: anchor,
+            anchorClasses: anchor && anchor.className,
+            isOrdered: anchor !== null && anchor.querySelector(".button-link-tick") !== null
+        };
+    });
+"""
+
+# Returns the date ids and texts of all lunch days (".jidelnicekDen") on the public page at once
+# Texts of ".jidelnicekItem" elements are grouped by their ".container"
+lunch_days_script = element_text_script + """
+    return Array.from(document.querySelectorAll(".jidelnicekDen"), lunchDay => {
+        const dateElement = lunchDay.querySelector(".jidelnicekTop");
+        return {
+            dateId: dateElement && dateElement.id,
+            containerTexts: Array.from(lunchDay.querySelectorAll(".container"),
+                                       container => Array.from(container.querySelectorAll(".jidelnicekItem"), text))
+        };
+    });
+"""
+
+# Lunch item (".jidelnicekItem") on the page of a logged User
+# The getters raise NoSuchElementException if the element is missing (like WebElement.find_element)
+class LunchItem:
+    def __init__(self, lunch_item_json: dict):
+        self.__menu_text: Optional[str] = lunch_item_json["menuText"]
+        self.__button_text: Optional[str] = lunch_item_json["buttonText"]
+        self.__anchor_classes: Optional[str] = lunch_item_json["anchorClasses"]
+        self.anchor: Optional[WebElement] = lunch_item_json["anchor"]
+        self.is_ordered: bool = lunch_item_json["isOrdered"]
+
+    @staticmethod
+    def __require(value: Optional[object], selector: str) -> object:
+        if value is None:
+            raise NoSuchElementException(f"Lunch item has no element matching '{selector}'!")
+        return value
+
+    def get_menu_text(self) -> str:
+        return LunchItem.__require(self.__menu_text, "[id^='menu-']")
+
+    def get_button_text(self) -> str:
+        return LunchItem.__require(self.__button_text, ".btn")
+
+    def get_anchor_classes(self) -> list[str]:
+        return LunchItem.__require(self.__anchor_classes, "a").split(" ")
+
+# Returns all lunch items on the current page of the driver using a single WebDriver command
+def get_lunch_items(driver: WebDriver) -> list[LunchItem]:
+    return [LunchItem(lunch_item_json) for lunch_item_json in driver.execute_script(lunch_items_script)]
+
+
+# Subclass of datetime.date, so comparing, hashing and day arithmetic are done by the C implementation
+# Neither __new__ nor __init__ is overridden, so Date objects are created (and pickled) the same way as datetime.date
+class Date(datetime_date):
+    __slots__ = ()
     __months: tuple[str] = ("?", "ledna", "února", "března", "dubna", "května", "června", "července", "srpna", "září", "října", "listopadu", "prosince")
 
     # Alternative constructor - creates Date using tuple
@@ -69,98 +192,88 @@ class Date:
         year, month, day = iso_format.split("-")
         return Date(int(year), int(month), int(day))
 
-    # Creates Date object using today's date
-    @staticmethod
-    def today() -> 'Date':
-        today = datetime.today()
-        return Date(today.year, today.month, today.day)
-
-    # Creates Date object using tomorrow's date
+    # Creates Date object using tomorrow's date (Date.today() is inherited from datetime.date)
     @staticmethod
     def tomorrow() -> 'Date':
-        tomorrow = datetime.today() + timedelta(days=1)
-        return Date(tomorrow.year, tomorrow.month, tomorrow.day)
+        return Date.today() + 1
 
-    def __init__(self, year: int, month: int, day: int):
-        if day < 1 or day > 31:
-            raise ValueError(f"Day parameter must be between 1 and 31!")
+    @property
+    def month_name(self) -> str:
+        return Date.__months[self.month]
 
-        if month < 1 or month > 12:
-            raise ValueError(f"Month value must be between 1 and 12!")
-
-        self.year: int = year
-        self.month: int = month
-        self.month_name: str = self.__months[month]
-        self.day: int = day
+    # Returns Dates when it's already too late to change Lunch - today, and tomorrow from 16:00
+    @staticmethod
+    def get_too_late_dates() -> set['Date']:
+        if datetime.now().hour >= 16:  # 15:10 can still change next day
+            return {Date.today(), Date.tomorrow()}
+        return {Date.today()}
 
     # Check if Lunch can be changed on this date
     def is_lunch_changeable(self) -> bool:
-        if self == self.today() or (self == self.tomorrow() and datetime.now().hour >= 16):  # 15:10 can still change next day
-            return False
-        for menu in Canteen.get_lunch_menus():
-            if menu.date == self:
-                return True
-        return False
+        return self not in Date.get_too_late_dates() and self in Canteen.get_lunch_menu_dates()
 
     def is_after(self, date: 'Date') -> bool:
-        return self.iso_format() > date.iso_format()
+        return self > date
 
     def is_before(self, date: 'Date') -> bool:
-        return self.iso_format() < date.iso_format()
+        return self < date
+
+    def iso_format(self) -> str:
+        return self.isoformat()
+
+    # Number of days since 1. 1. 0001 (which has 1), see datetime.toordinal
+    def to_ordinal(self) -> int:
+        return self.toordinal()
 
     @staticmethod
-    def __pad_with_zeros(desired_len: int, s: object) -> str:
-        return f"{'0' * desired_len}{s}"[-desired_len:]
+    def from_ordinal(ordinal: int) -> 'Date':
+        return Date.fromordinal(ordinal)
 
-    def iso_format(self) -> str:
-        return f"{self.year}-{Date.__pad_with_zeros(2, self.month)}-{Date.__pad_with_zeros(2, self.day)}"
+    # Yields all Dates from from_date to to_date (both including)
+    @staticmethod
+    def iter_range(from_date: 'Date', to_date: 'Date'):
+        for ordinal in range(from_date.toordinal(), to_date.toordinal() + 1):
+            yield Date.fromordinal(ordinal)
 
     def __add__(self, other):
         if type(other) is int:
-            days = other
-            new_time = datetime(self.year, self.month, self.day) + timedelta(days=days)
-            return Date(new_time.year, new_time.month, new_time.day)
+            return Date.fromordinal(self.toordinal() + other)
         else:
             raise TypeError(f"You can only add int representing the number of days.")
 
     def __str__(self):
         return f"{self.day}. {self.month_name} {self.year}"
 
-    def __eq__(self, other):
-        if isinstance(other, Date):
-            return self.year == other.year and self.month == other.month and self.day == other.day
-        return False
-
-    def __lt__(self, other):
-        return self.is_before(other)
-
-    def __gt__(self, other):
-        return self.is_after(other)
-
-    def __hash__(self):
-        return hash((self.year, self.month, self.day))
-
 
 # Represents a Lunch object
 class Lunch:
-    def __init__(self, date: Date, number: int, soup: str, main_dish: str, is_ordered: bool = False):
-        def format_dish(dish: str):
-            if dish is None:
-                return None
-            dish = dish.lower()
-            del_from = dish.find("oběd pro studenta")
-            if del_from != -1:
-                dish = dish[:del_from]
-            dish = dish.replace(",", " ").replace("   ", " ")
-            dish = dish.strip().replace("   ", " ").replace("  ", " ").replace(";", "")
-            return dish.replace('"', '').replace("\n", "").strip()
+    # No __dict__ for each instance, there are many lunches in the cached lunch menus
+    __slots__ = ("date", "number", "soup", "main_dish", "is_ordered")
 
+    # Characters deleted from the dish by __format_dish (after the spaces are replaced)
+    __deleted_dish_chars: dict[int, None] = str.maketrans("", "", ';"\n')
+    # Brackets and their content, an unclosed bracket removes everything after it
+    __brackets_pattern: re.Pattern = re.compile(r"\([^)]*(?:\)|\Z)|\[[^\]]*(?:\]|\Z)")
+
+    def __init__(self, date: Date, number: int, soup: str, main_dish: str, is_ordered: bool = False):
         self.date: Date = date
         self.number: int = number
-        self.soup: str = format_dish(soup)
-        self.main_dish: str = format_dish(main_dish)
+        self.soup: str = Lunch.__format_dish(soup)
+        self.main_dish: str = Lunch.__format_dish(main_dish)
         self.is_ordered: bool = is_ordered
 
+    @staticmethod
+    def __format_dish(dish: str) -> Optional[str]:
+        if dish is None:
+            return None
+        dish = dish.lower()
+        del_from = dish.find("oběd pro studenta")
+        if del_from != -1:
+            dish = dish[:del_from]
+        dish = dish.replace(",", " ").replace("   ", " ")
+        dish = dish.strip().replace("   ", " ").replace("  ", " ")
+        return dish.translate(Lunch.__deleted_dish_chars).strip()
+
     def __str__(self):
         return f"Oběd č. {self.number} dne {self.date} > Polévka: „{self.soup}“ \t Hlavní chod: „{self.main_dish}“"
 
@@ -178,28 +291,17 @@ class Lunch:
         return False
 
     # Removes all brackets, and it's content
+    # The results are cached, because the same lunches repeat in many lunch menus
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def __remove_brackets_from_lunch(lunch: str) -> str:
-        parentheses, square_brackets = False, False
-        s = ""
-        for c in lunch:
-            if parentheses:
-                if c == ')':
-                    parentheses = False
-            elif square_brackets:
-                if c == ']':
-                    square_brackets = False
-            elif c == '(':
-                parentheses = True
-            elif c == '[':
-                square_brackets = True
-            else:
-                s += c
-        return s.strip()
+        return Lunch.__brackets_pattern.sub("", lunch).strip()
 
     # Extracts soup and main_dish name from the lunch and returns it as tuple: (soup, main_dish)
     # You can specify the sep (separator) for separating the soup from the main_dish
+    # The results are cached (the returned tuple can't be modified)
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def get_soup_and_main_dish(lunch: str, sep: str = ";") -> Optional[tuple[str, str]]:
         lunch = Lunch.__remove_brackets_from_lunch(lunch)
         idx = lunch.find(sep)
@@ -213,26 +315,31 @@ class Lunch:
 
 # Represents a list of Lunches (usually 3) for specific day
 class LunchMenu(list):
+    __slots__ = ("date", "ordered_lunch", "shared_dish", "shared_soup")
+
     def __init__(self, lunches: list[Lunch]):
         if lunches is None or len(lunches) == 0:
             raise ValueError("Lunches must not be None and must have len >= 1.")
 
-        # Ensure all items in lunches are of type Lunch
-        if not all(isinstance(lunch, Lunch) for lunch in lunches):
-            raise TypeError("All items in lunches must be instances of the Lunch class.")
-
-        # Ensure all lunches have the same date
-        first_date = lunches[0].date
-        if not all(lunch.date == first_date for lunch in lunches):
-            raise ValueError("All lunches must have the same date.")
-
-        # Count lunches by status
+        # Check all lunches and count them by status in a single pass
+        # Ensure all items in lunches are of type Lunch (checked before anything else is read from them)
+        # Ensure all lunches have the same date (raised after all the items are checked to be of type Lunch)
+        first_date, same_date = None, True
         ordered_lunch, ordered_count = None, 0
-        for lunch in lunches:
+        for lunch_index, lunch in enumerate(lunches):
+            if not isinstance(lunch, Lunch):
+                raise TypeError("All items in lunches must be instances of the Lunch class.")
+            if lunch_index == 0:
+                first_date = lunch.date
+            elif lunch.date != first_date:
+                same_date = False
             if lunch.is_ordered:
                 ordered_count += 1
                 ordered_lunch = lunch
 
+        if not same_date:
+            raise ValueError("All lunches must have the same date.")
+
         # There can be only 1 lunch ordered each day
         if ordered_count > 1:
             raise Exception(f"There are {ordered_count} ordered lunches at the same day! There can be only 1!")
@@ -262,23 +369,7 @@ class LunchMenu(list):
 
             if starts_with_same:
                 if lunch_with_longest_soup is not None:
-                    shared_to_idx = 0
-                    stop = False
-                    for i in range(len(lunch_with_longest_soup.soup)):
-                        try:
-                            first_c = None
-                            for lunch in self:
-                                c = lunch.soup[i]
-                                if first_c is None:
-                                    first_c = c
-                                elif c != first_c:
-                                    stop = True
-                                    break
-                        except:
-                            stop = True
-                        if stop:
-                            break
-                        shared_to_idx += 1
+                    shared_to_idx = len(os.path.commonprefix([lunch.soup for lunch in self]))
                     soup_and_main_dish = f"{lunch_with_longest_soup.soup} {lunch_with_longest_soup.main_dish}".replace("  ", " ")
                     lunch_with_longest_soup.soup = soup_and_main_dish[:shared_to_idx].strip()
                     lunch_with_longest_soup.main_dish = soup_and_main_dish[shared_to_idx:].strip()
@@ -286,26 +377,13 @@ class LunchMenu(list):
                     self.shared_soup = self.__get_shared_soup()
 
         # Find shared endings of main_dish(es), delete them, and save them as shared_dish
+        # Words of all main_dishes are compared from the end, until the shortest main_dish runs out of words
         shared_words = []
-        curr_index = -1
-        while True:
-            try:
-                word = None
-                word_is_shared = True
-                for lunch in lunches:
-                    w = lunch.main_dish.split(" ")[curr_index]
-                    if word is None:
-                        word = w
-                    if w != word:
-                        word_is_shared = False
-                        break
-                if word_is_shared:
-                    shared_words.append(word)
-                else:
-                    break
-                curr_index -= 1
-            except IndexError:
+        for words in zip(*[reversed(lunch.main_dish.split(" ")) for lunch in lunches]):
+            word = words[0]
+            if any(w != word for w in words):
                 break
+            shared_words.append(word)
         shared_ending = " ".join(reversed(shared_words))
         if shared_ending:
             self.shared_dish = shared_ending
@@ -351,7 +429,7 @@ class LunchMenu(list):
 # Class representing the logged User
 class User:
     def __init__(self, username: str, password: str):
-        driver = create_driver()
+        driver = acquire_driver()
         driver.get(Canteen.url)
 
         driver.find_element(By.ID, "j_username").send_keys(username)
@@ -361,28 +439,34 @@ class User:
         wait_for_page_load(driver)
 
         if "objednání" not in driver.title:  # Login failed
-            driver.quit()
+            release_driver(driver)
             raise Exception(f"Login wasn't successful, check the credentials: {username} {'*' * len(password)}")
 
         # Login successful
         self.username: str = username
         self.password: str = password
-        self.driver: WebDriver = driver
+        self.driver: Optional[WebDriver] = driver  # None after logout
+        # Url of the page after login, lunch pages of the specific days differ only in the day param
+        # The url is parsed only once, the url of a day is then just the day inserted between the two parts
+        self.__lunch_url_parts: tuple[str, str] = self.__split_url_at_param(driver.current_url, "day")
 
         self.first_name = driver.find_element(By.CSS_SELECTOR, "[id*=firstName]").text
         self.last_name = driver.find_element(By.CSS_SELECTOR, "[id*=lastName]").text
         self.full_name = f"{self.first_name} {self.last_name}"
 
+        # The page after login already shows the current credit, no need to refresh it
         self.__credit_up_to_date = False
-        self.__update_credit()
+        self.__update_credit(refresh=False)
 
     # Updates the credit status
-    def __update_credit(self) -> None:
+    # refresh = Reload the page first, needed when the credit might have changed since the page was loaded
+    def __update_credit(self, refresh: bool = True) -> None:
         credit_content_selector = By.ID, "kreditInclude"  # Do not change By.ID without first modifying execute_script!
         credit_info_selector = By.CSS_SELECTOR, ".topMenuItem"
 
-        self.driver.execute_script(f"$('#{credit_content_selector[1]}').empty();")
-        self.driver.refresh()
+        if refresh:
+            self.driver.execute_script(f"$('#{credit_content_selector[1]}').empty();")
+            self.driver.refresh()
         wait_for_page_load(self.driver, wait_for_el=credit_info_selector, wait_for_multiple=True)
 
         credit_info = self.driver.find_element(*credit_content_selector).find_elements(*credit_info_selector)
@@ -410,43 +494,43 @@ class User:
         self.driver.find_element(By.ID, "logout").submit()
         wait_for_page_load(self.driver)
         successful = "přihlášení" in self.driver.title
-        self.driver.quit()
+        # The driver may be given to someone else now, so this User must not use it anymore
+        driver, self.driver = self.driver, None
+        release_driver(driver)
         return successful
 
     # Returns LunchMenu for specified Date
     def get_lunch_menu(self, date: Date) -> Optional[LunchMenu]:
-        # Modify day param in the url
-        target_url = self.__url_set_param(self.driver.current_url, "day", date.iso_format())
+        return self.__get_lunch_menu_using(self.driver, date)
 
-        # Go to that url
-        self.driver.get(target_url)
-        wait_for_page_load(self.driver)
+    # Returns the url of the page with lunches for the specified Date
+    def __get_lunch_url(self, date: Date) -> str:
+        url_start, url_end = self.__lunch_url_parts
+        return f"{url_start}{date.iso_format()}{url_end}"
+
+    def __get_lunch_menu_using(self, driver: WebDriver, date: Date) -> Optional[LunchMenu]:
+        # Go to the page of that day
+        driver.get(self.__get_lunch_url(date))
+        wait_for_page_load(driver)
 
         # Scrape lunches, save them as LunchMenu and return it
         lunches = []
         lunch_number = 1
-        lunch_items = self.driver.find_elements(By.CSS_SELECTOR, ".jidelnicekItem")
-        for lunch_item in lunch_items:
-            lunch_info = lunch_item.find_element(By.CSS_SELECTOR, "[id^='menu-']").text
-            lunch_order_button = lunch_item.find_element(By.CSS_SELECTOR, ".btn")
+        for lunch_item in get_lunch_items(driver):
+            lunch_info = lunch_item.get_menu_text()
+            lunch_order_button_text = lunch_item.get_button_text()
             soup_and_dish = Lunch.get_soup_and_main_dish(lunch_info)
             if soup_and_dish is not None:
                 soup, main_dish = soup_and_dish
 
-                if f"Oběd {lunch_number}" not in lunch_order_button.text:
+                if f"Oběd {lunch_number}" not in lunch_order_button_text:
                     return None
                     # raise Exception(f"Lunch numbers must be the same! '{
-                    #     lunch_order_button.text.replace('\n', '')}' does not correspond with lunch number {lunch_number}!")
+                    #     lunch_order_button_text.replace('\n', '')}' does not correspond with lunch number {lunch_number}!")
 
-                anchor = lunch_item.find_element(By.TAG_NAME, "a")
-                classes = anchor.get_attribute("class").split(" ")
+                classes = lunch_item.get_anchor_classes()
                 can_be_changed = "ordered" in classes or "enabled" in classes
-                is_ordered = False
-                try:
-                    if anchor.find_element(By.CSS_SELECTOR, ".button-link-tick"):
-                        is_ordered = True
-                except:
-                    pass
+                is_ordered = lunch_item.is_ordered
 
                 lunches.append(Lunch(date, lunch_number, soup, main_dish, is_ordered))
             lunch_number += 1
@@ -463,12 +547,10 @@ class User:
 
         # Collect all the lunch_menus between from_date and to_date and append them to lunch_menus
         lunch_menus = []
-        curr_date = from_date
-        while not curr_date.is_after(to_date):
+        for curr_date in Date.iter_range(from_date, to_date):
             lunch_menu = self.get_lunch_menu(curr_date)
             if lunch_menu is not None:
                 lunch_menus.append(lunch_menu)
-            curr_date += 1
         return lunch_menus
 
     __max_recursion_depth = 3
@@ -478,31 +560,36 @@ class User:
     # Returns True if all went OK, otherwise False, works perfectly only in safe_mode
     # safe_mode = Check if it was successful, otherwise try once more, takes longer
     def set_lunch(self, date: Date, lunch_number: int, safe_mode: bool = True, recursion_depth: int = 1) -> bool:
+        return self.__set_lunch_using(self.driver, date, lunch_number, safe_mode, recursion_depth)
+
+    # check_login = Return None if the driver turns out not to be logged in (checked on the page of that day)
+    def __set_lunch_using(self, driver: WebDriver, date: Date, lunch_number: int, safe_mode: bool = True,
+                          recursion_depth: int = 1, check_login: bool = False) -> Optional[bool]:
         # Check if it's possible to change Lunch on this date
         if not date.is_lunch_changeable():
             return False
 
-        # Modify day param in the url
-        target_url = self.__url_set_param(self.driver.current_url, "day", date.iso_format())
+        # Go to the page of that day
+        driver.get(self.__get_lunch_url(date))
+        wait_for_page_load(driver)
 
-        # Go to that url
-        self.driver.get(target_url)
-        wait_for_page_load(self.driver)
+        # The same check as after the login
+        if check_login and "objednání" not in driver.title:
+            return None
 
         # Order specified lunch
         probably_success, interacted = None, False
         curr_lunch_number = 1
-        lunch_items = self.driver.find_elements(By.CSS_SELECTOR, ".jidelnicekItem")
-        for lunch_item in lunch_items:
-            lunch_order_button = lunch_item.find_element(By.CSS_SELECTOR, ".btn")
+        for lunch_item in get_lunch_items(driver):
+            lunch_order_button_text = lunch_item.get_button_text()
 
-            if f"Oběd {curr_lunch_number}" not in lunch_order_button.text:
+            if f"Oběd {curr_lunch_number}" not in lunch_order_button_text:
                 raise Exception(f"Lunch numbers must be the same! '{
-                    lunch_order_button.text.replace('\n', '')}' does not correspond with lunch number {curr_lunch_number}!")
+                    lunch_order_button_text.replace('\n', '')}' does not correspond with lunch number {curr_lunch_number}!")
 
             if lunch_number == curr_lunch_number or lunch_number == 0:
-                anchor = lunch_item.find_element(By.TAG_NAME, "a")
-                classes = anchor.get_attribute("class").split(" ")
+                classes = lunch_item.get_anchor_classes()
+                anchor = lunch_item.anchor
                 if "ordered" in classes:
                     if lunch_number == 0:
                         anchor.click()
@@ -524,7 +611,7 @@ class User:
             probably_success = lunch_number == 0
 
         if safe_mode and (interacted or not probably_success):
-            menu = self.get_lunch_menu(date)
+            menu = self.__get_lunch_menu_using(driver, date)
             if menu is None:
                 return False
             if menu.ordered_lunch is None:
@@ -536,7 +623,7 @@ class User:
             # Unable to set lunch, let's try it again few more times
             recursion_depth += 1
             if recursion_depth <= self.__max_recursion_depth:
-                return self.set_lunch(date, lunch_number, safe_mode, recursion_depth)
+                return self.__set_lunch_using(driver, date, lunch_number, safe_mode, recursion_depth)
             else:
                 return False
         else:
@@ -548,13 +635,49 @@ class User:
 
     # Cancels all lunches if possible
     # Returns True if all lunches were cancelled successfully, otherwise False
-    def cancel_all_lunches(self, safe_mode: bool = True) -> bool:
+    # parallel = Cancel the days in parallel, each by its own driver logged in the same session (EXPERIMENTAL)
+    #          - Not tested against the website yet, concurrent changes in one session might not be handled well
+    #          - Days whose driver couldn't be logged in are cancelled one by one using self.driver afterwards
+    def cancel_all_lunches(self, safe_mode: bool = True, parallel: bool = False) -> bool:
+        dates = Canteen.get_lunch_changeable_dates()
+        if not parallel or len(dates) <= 1 or max_idle_drivers <= 1:
+            successful = True
+            for date in dates:
+                if not self.cancel_lunch(date, safe_mode=safe_mode):
+                    successful = False
+            return successful
+
+        # Cookies are read here, self.driver must not be used by multiple threads at once
+        cookies = self.driver.get_cookies()
+        # Returns None if the driver wasn't logged in, so the lunch wasn't cancelled
+        def cancel_lunch_using_own_driver(date: Date) -> Optional[bool]:
+            driver = acquire_driver()
+            try:
+                self.__share_session(driver, cookies)
+                return self.__set_lunch_using(driver, date, 0, safe_mode=safe_mode, check_login=True)
+            finally:
+                release_driver(driver)
+
+        with ThreadPoolExecutor(max_workers=min(max_idle_drivers, len(dates))) as executor:
+            results = list(executor.map(cancel_lunch_using_own_driver, dates))
+
         successful = True
-        for date in Canteen.get_lunch_changeable_dates():
-            if not self.cancel_lunch(date, safe_mode=safe_mode):
+        for date, result in zip(dates, results):
+            if result is None:
+                result = self.cancel_lunch(date, safe_mode=safe_mode)
+            if not result:
                 successful = False
         return successful
 
+    # Logs the driver in the same session as this User by copying the cookies (of self.driver.get_cookies())
+    # Cookies can be added only for the current domain, so the website has to be opened first
+    # Whether it worked is checked only on the next page (see check_login of __set_lunch_using)
+    @staticmethod
+    def __share_session(driver: WebDriver, cookies: list[dict]) -> None:
+        driver.get(Canteen.url)
+        for cookie in cookies:
+            driver.add_cookie(cookie)
+
     # Modifies an url to have the specified param with the specified value
     @staticmethod
     def __url_set_param(url: str, param: str, value: object) -> str:
@@ -565,42 +688,113 @@ class User:
         target_url = urlunparse(parsed_url._replace(query=new_query))
         return str(target_url)
 
+    # Returns the url with the specified param split in two parts at the value of the param
+    # url_start + value + url_end is the same as __url_set_param(url, param, value), for a value not changed by urlencode
+    @staticmethod
+    def __split_url_at_param(url: str, param: str) -> tuple[str, str]:
+        value_placeholder = "PARAM-VALUE-PLACEHOLDER"
+        url_start, _, url_end = User.__url_set_param(url, param, value_placeholder).partition(value_placeholder)
+        return url_start, url_end
+
 
 # Class representing the school canteen
 # Only static methods
 class Canteen:
     url: str = "https://jidelna.sjrako.cz/login"
-    __driver: WebDriver = None
-    __last_lunch_menus_update, __lunch_menus = None, None
+    __last_lunch_menus_update, __lunch_menus, __lunch_menu_dates, __lunch_menus_by_date = None, None, None, None
+
+    # Lunch menus scraped today are saved to this file, so other runs of the program don't have to scrape them again
+    lunch_menus_cache_filepath: str = f"{ROOT_DIR}/data/lunch-menus-cache.json"
 
     # Returns a list of publicly available LunchMenus from "https://jidelna.sjrako.cz/login"
     # Each LunchMenu is a list of Lunches
     @staticmethod
     def get_lunch_menus() -> list[LunchMenu]:
-        # If there's no need for an update, just return cached lunch menus
+        Canteen.__update_lunch_menus()
+        return Canteen.__lunch_menus.copy()
+
+    # Returns a set of Dates of all publicly available LunchMenus
+    @staticmethod
+    def get_lunch_menu_dates() -> frozenset[Date]:
+        Canteen.__update_lunch_menus()
+        return Canteen.__lunch_menu_dates
+
+    # Updates the cached lunch menus, if they weren't updated today yet
+    @staticmethod
+    def __update_lunch_menus() -> None:
+        # If there's no need for an update, just keep the cached lunch menus
         today = Date.today()
         if Canteen.__last_lunch_menus_update is not None and Canteen.__last_lunch_menus_update == today:
-            return Canteen.__lunch_menus.copy()
+            return
 
-        # Create a new driver if it doesn't exist
-        if not Canteen.__driver:
-            Canteen.__driver = create_driver()
+        # Lunch menus scraped earlier today are loaded from the cache file, otherwise they are scraped and saved there
+        lunch_menus = Canteen.__load_lunch_menus_cache(today)
+        if lunch_menus is None:
+            lunch_days = Canteen.__scrape_lunch_days()
+            lunch_menus = Canteen.__lunch_menus_from_lunch_days(lunch_days)
+            # No lunch menus usually means a maintenance (or not fully loaded) page, the next run should scrape again
+            if len(lunch_menus) != 0:
+                Canteen.__save_lunch_menus_cache(lunch_days, today)
 
-        # Scrape all the Lunches and add them to the list
-        lunch_menus = []
-        Canteen.__driver.get(Canteen.url)
+        Canteen.__last_lunch_menus_update = today
+        Canteen.__lunch_menus = lunch_menus
+        Canteen.__lunch_menu_dates = frozenset(menu.date for menu in lunch_menus)
+        # Reversed, so the first LunchMenu of a date is kept if there are more of them
+        Canteen.__lunch_menus_by_date = {menu.date: menu for menu in reversed(lunch_menus)}
+
+    # Returns lunch menus from the cache file if they were scraped on the specified date, otherwise None
+    # The cache contains the scraped texts, so the lunch menus are created exactly the same way as after scraping
+    # An empty list of lunch menus is never a valid cache, they are scraped again
+    @staticmethod
+    def __load_lunch_menus_cache(date: Date) -> Optional[list[LunchMenu]]:
+        try:
+            with open(Canteen.lunch_menus_cache_filepath, "r", encoding="utf-8") as f:
+                json_obj = json.load(f)
+            if json_obj.get("date") != date.iso_format():
+                return None
+            lunch_menus = Canteen.__lunch_menus_from_lunch_days(json_obj["lunchDays"])
+            return lunch_menus if len(lunch_menus) != 0 else None
+        except (OSError, ValueError, KeyError, IndexError, TypeError, AttributeError):  # No cache file yet or unreadable, scrape the lunch menus
+            return None
 
-        lunch_days = Canteen.__driver.find_elements(By.CSS_SELECTOR, ".jidelnicekDen")
+    # Saves lunch days (as returned by __scrape_lunch_days) scraped on the specified date to the cache file
+    @staticmethod
+    def __save_lunch_menus_cache(lunch_days: list[dict], date: Date) -> None:
+        json_obj = {"date": date.iso_format(), "lunchDays": lunch_days}
+        temp_filepath = f"{Canteen.lunch_menus_cache_filepath}.tmp"
+        try:
+            # json.dumps without indent uses the C encoder (json.dump never does), the cache doesn't need to be readable
+            with open(temp_filepath, "w", encoding="utf-8") as f:
+                f.write(json.dumps(json_obj, ensure_ascii=False, separators=(",", ":")))
+            os.replace(temp_filepath, Canteen.lunch_menus_cache_filepath)
+        except OSError:  # The cache is only an optimization, lunch menus will be scraped again next time
+            pass
+
+    # Scrapes the publicly available lunch days from the website, as returned by lunch_days_script
+    # The driver is only borrowed for the scraping, so it can be used by a User afterwards
+    @staticmethod
+    def __scrape_lunch_days() -> list[dict]:
+        driver = acquire_driver()
+        try:
+            driver.get(Canteen.url)
+            return driver.execute_script(lunch_days_script)
+        finally:
+            release_driver(driver)
+
+    # Creates LunchMenus from the scraped lunch days
+    @staticmethod
+    def __lunch_menus_from_lunch_days(lunch_days: list[dict]) -> list[LunchMenu]:
+        # Read all the Lunches and add them to the list
+        lunch_menus = []
         for lunch_day in lunch_days:
             lunches = []
-            date_el = lunch_day.find_element(By.CSS_SELECTOR, ".jidelnicekTop")
-            date = Date.from_tuple(tuple(map(lambda d: int(d), date_el.get_attribute("id").split("-")[1:])))
+            if lunch_day["dateId"] is None:
+                raise NoSuchElementException("Lunch day has no element matching '.jidelnicekTop'!")
+            date = Date.from_tuple(tuple(map(lambda d: int(d), lunch_day["dateId"].split("-")[1:])))
 
             lunch_number = 1
-            lunch_containers = lunch_day.find_elements(By.CSS_SELECTOR, ".container")
-            for lunch_container in lunch_containers:
-                elements = lunch_container.find_elements(By.CSS_SELECTOR, ".jidelnicekItem")
-                lunch_number_str, lunch = elements[0].text, elements[1].text
+            for texts in lunch_day["containerTexts"]:
+                lunch_number_str, lunch = texts[0], texts[1]
 
                 if int(lunch_number_str.split(" ")[-1]) != lunch_number:
                     raise Exception(f"Lunch numbers must be the same! '{lunch_number_str}' does not correspond with {lunch_number}!")
@@ -614,18 +808,13 @@ class Canteen:
             if len(lunches) != 0:
                 lunch_menus.append(LunchMenu(lunches))
 
-        Canteen.__last_lunch_menus_update = today
-        Canteen.__lunch_menus = lunch_menus
-        return lunch_menus.copy()
+        return lunch_menus
 
     # Returns a LunchMenu for a specific date
     @staticmethod
     def get_lunch_menu(date: Date) -> Optional[LunchMenu]:
-        lunch_menus = Canteen.get_lunch_menus()
-        for menu in lunch_menus:
-            if menu.date == date:
-                return menu
-        return None
+        Canteen.__update_lunch_menus()
+        return Canteen.__lunch_menus_by_date.get(date)
 
     # Logs in with specified username and password and returns User object
     @staticmethod
@@ -635,11 +824,8 @@ class Canteen:
     # Returns a list of all Dates when the lunch can be changed
     @staticmethod
     def get_lunch_changeable_dates() -> list[Date]:
-        dates = []
-        for menu in Canteen.get_lunch_menus():
-            if menu.date.is_lunch_changeable():
-                dates.append(menu.date)
-        return dates
+        too_late_dates = Date.get_too_late_dates()
+        return [menu.date for menu in Canteen.get_lunch_menus() if menu.date not in too_late_dates]
 
     # Returns the last lunch-changeable date
     @staticmethod
@@ -650,6 +836,17 @@ class Canteen:
 DEFAULT_JSON_LUNCH_MENUS_FILEPATH = f"{ROOT_DIR}/data/lunch-menus.json"
 # Saves a list of LunchMenus as a JSON file
 def save_lunch_menus(lunch_menus: list[LunchMenu], filepath: str = DEFAULT_JSON_LUNCH_MENUS_FILEPATH) -> None:
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(lunch_menus_to_json(lunch_menus), f, indent=2, ensure_ascii=False)
+        
+# Loads a list of lunch menus from a JSON file
+def load_lunch_menus(filepath: str = DEFAULT_JSON_LUNCH_MENUS_FILEPATH) -> list[LunchMenu]:
+    with open(filepath, "r", encoding="utf-8") as f:
+        json_obj = json.load(f)
+    return lunch_menus_from_json(json_obj)
+
+# Converts a list of LunchMenus to a JSON object (as saved by save_lunch_menus)
+def lunch_menus_to_json(lunch_menus: list[LunchMenu]) -> dict:
     json_obj = {
         "lunchMenus": []
     }
@@ -674,14 +871,10 @@ def save_lunch_menus(lunch_menus: list[LunchMenu], filepath: str = DEFAULT_JSON_
                 del lunch_json["soup"]
             lunch_menu_json["lunches"].append(lunch_json)
         json_obj["lunchMenus"].append(lunch_menu_json)
+    return json_obj
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(json_obj, f, indent=2, ensure_ascii=False)
-        
-# Loads a list of lunch menus from a JSON file
-def load_lunch_menus(filepath: str = DEFAULT_JSON_LUNCH_MENUS_FILEPATH) -> list[LunchMenu]:
-    with open(filepath, "r", encoding="utf-8") as f:
-        json_obj = json.load(f)
+# Creates a list of LunchMenus from a JSON object (as loaded by load_lunch_menus)
+def lunch_menus_from_json(json_obj: dict) -> list[LunchMenu]:
     lunch_menus = []
     for lunch_menu_json in json_obj["lunchMenus"]:
         date = Date.from_iso_format(lunch_menu_json["date"])